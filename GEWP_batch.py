@@ -0,0 +1,184 @@
+"""Headless batch export for Grid Empire World Planner .map projects.
+
+Renders map images and block lists for many projects without opening the Tk app:
+
+    python GEWP_batch.py maps/ -o exports/ --background backgrounds/GE_spring_background.jpg
+    python GEWP_batch.py a.map b.map --list-format csv --no-image
+    python GEWP_batch.py maps/ -o site/ --pyramid --no-list
+
+Directories are searched for *.map files (use -r to recurse). Files are processed in
+parallel across all cores and outputs newer than their inputs are skipped unless --force
+is given. Exits with status 1 if any file failed.
+"""
+import argparse
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from PIL import Image
+
+from GEWP_main import (PYRAMID_MANIFEST, TileBuilderApp, count_blocks, export_tile_pyramid, format_block_list,
+                       load_tile_images, read_project_file, render_map_image)
+
+# Per-process cache so each worker decodes a tile folder / background only once
+_tile_cache = {}
+_background_cache = {}
+
+
+def get_tiles(tile_dir):
+    tile_dir = os.path.abspath(tile_dir)
+    if tile_dir not in _tile_cache:
+        if not os.path.isdir(tile_dir):
+            raise FileNotFoundError(f"Tile directory '{tile_dir}' not found.")
+        tile_images, tile_name_to_index = load_tile_images(tile_dir, TileBuilderApp.TILE_ASSET_SIZE)
+        index_to_name = {index: name for name, index in tile_name_to_index.items()}
+        _tile_cache[tile_dir] = (tile_images, index_to_name)
+    return _tile_cache[tile_dir]
+
+
+def get_background(path):
+    if path is None:
+        return None
+    if path not in _background_cache:
+        _background_cache[path] = Image.open(path).convert("RGBA")
+    return _background_cache[path]
+
+
+def find_map_files(inputs, recursive=False):
+    """Expands files and directories into a sorted list of .map paths."""
+    map_files = []
+    for path in inputs:
+        if os.path.isdir(path):
+            if recursive:
+                for root, _, files in os.walk(path):
+                    map_files += [os.path.join(root, f) for f in files if f.endswith(".map")]
+            else:
+                map_files += [os.path.join(path, f) for f in os.listdir(path) if f.endswith(".map")]
+        else:
+            map_files.append(path)
+    return sorted(map_files)
+
+
+def output_paths(map_path, args):
+    base = os.path.splitext(os.path.basename(map_path))[0]
+    out_dir = args.output or os.path.dirname(map_path)
+    outputs = {}
+    if not args.no_image:
+        outputs["image"] = os.path.join(out_dir, base + ".png")
+    if not args.no_list:
+        outputs["list"] = os.path.join(out_dir, f"{base}_blocks.{args.list_format}")
+    if args.pyramid:
+        outputs["pyramid"] = os.path.join(out_dir, f"{base}_tiles", PYRAMID_MANIFEST)
+    return outputs
+
+
+def dependency_mtime(path):
+    """mtime of a file, or for a directory the newest of it and its .png files (editing a tile in
+    place does not change the directory's own mtime)."""
+    mtime = os.path.getmtime(path)
+    if os.path.isdir(path):
+        mtime = max([mtime] + [entry.stat().st_mtime for entry in os.scandir(path) if entry.name.endswith(".png")])
+    return mtime
+
+
+def is_up_to_date(map_path, outputs, dependencies, mtimes=None):
+    """True when every output exists and is newer than the map file and its dependencies (files or
+    tile folders). mtimes caches dependency_mtime results across maps."""
+    mtimes = {} if mtimes is None else mtimes
+    newest_input = os.path.getmtime(map_path)
+    for path in dependencies:
+        if path and os.path.exists(path):
+            if path not in mtimes:
+                mtimes[path] = dependency_mtime(path)
+            newest_input = max(newest_input, mtimes[path])
+    return all(os.path.exists(p) and os.path.getmtime(p) >= newest_input for p in outputs.values())
+
+
+def process_map(map_path, outputs, tile_dir, background_path, list_format, tile_size):
+    """Worker: renders/reports one map. Returns the elapsed time in seconds."""
+    start = time.perf_counter()
+    project = read_project_file(map_path, TileBuilderApp.NUM_LAYERS)
+    tile_images, index_to_name = get_tiles(tile_dir or project['tile_dir'])
+
+    if "image" in outputs:
+        image = render_map_image(
+            project['map_data'], project['map_rotation'], project['map_mirror'], tile_images,
+            background=get_background(background_path), tile_size=tile_size
+        )
+        image.save(outputs["image"])
+
+    if "pyramid" in outputs:
+        # Only tiles whose content hash changed are re-rendered; already threaded, so one worker thread here
+        export_tile_pyramid(
+            os.path.dirname(outputs["pyramid"]), project['map_data'], project['map_rotation'],
+            project['map_mirror'], tile_images, background=get_background(background_path),
+            tile_size=tile_size, workers=1
+        )
+
+    if "list" in outputs:
+        with open(outputs["list"], "w") as f:
+            f.write(format_block_list(count_blocks(project['map_data']), index_to_name, list_format))
+
+    return time.perf_counter() - start
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Render map images and block lists for .map projects.")
+    parser.add_argument("inputs", nargs="+", help=".map files or directories containing them")
+    parser.add_argument("-o", "--output", help="output directory (default: next to each .map file)")
+    parser.add_argument("-r", "--recursive", action="store_true", help="search directories recursively")
+    parser.add_argument("--tiles", help="tile folder (default: the tile_dir stored in each project)")
+    parser.add_argument("--background", help="background image to render under the tiles")
+    parser.add_argument("--tile-size", type=int, default=TileBuilderApp.TILE_ASSET_SIZE, help="pixels per cell")
+    parser.add_argument("--list-format", choices=["txt", "csv", "json"], default="txt")
+    parser.add_argument("--no-image", action="store_true", help="skip the map image")
+    parser.add_argument("--no-list", action="store_true", help="skip the block list")
+    parser.add_argument("--pyramid", action="store_true", help="also write a {z}/{x}/{y}.png tile pyramid")
+    parser.add_argument("-j", "--jobs", type=int, default=None, help="worker processes (default: all cores)")
+    parser.add_argument("-f", "--force", action="store_true", help="rebuild outputs even if up to date")
+    args = parser.parse_args(argv)
+
+    if args.output:
+        os.makedirs(args.output, exist_ok=True)
+
+    jobs = []
+    skipped = 0
+    mtimes = {}
+    for map_path in find_map_files(args.inputs, args.recursive):
+        outputs = output_paths(map_path, args)
+        if not outputs:
+            continue
+        if not args.force and all(os.path.exists(p) for p in outputs.values()):
+            try:
+                tile_dir = args.tiles or read_project_file(map_path, TileBuilderApp.NUM_LAYERS)['tile_dir']
+            except Exception:
+                tile_dir = None     # Unreadable project: let the worker report it
+            if tile_dir is not None and is_up_to_date(map_path, outputs, [tile_dir, args.background], mtimes):
+                skipped += 1
+                continue
+        jobs.append((map_path, outputs))
+
+    failures = 0
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=args.jobs) as pool:
+        futures = {
+            pool.submit(process_map, map_path, outputs, args.tiles, args.background,
+                        args.list_format, args.tile_size): map_path
+            for map_path, outputs in jobs
+        }
+        for future in as_completed(futures):
+            map_path = futures[future]
+            try:
+                print(f"{map_path}: {future.result():.2f}s")
+            except Exception as e:
+                failures += 1
+                print(f"{map_path}: FAILED ({e})", file=sys.stderr)
+
+    print(f"{len(jobs) - failures} exported, {skipped} up to date, {failures} failed "
+          f"in {time.perf_counter() - start:.2f}s")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
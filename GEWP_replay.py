@@ -0,0 +1,91 @@
+"""Replays an input session recorded in Grid Empire World Planner (F9) and reports handler latency.
+
+    python GEWP_replay.py lag_report.session
+    python GEWP_replay.py lag_report.session --repeat 5 --json timings.json
+
+The app is opened with the session's window size, map and view state, then every recorded
+handler call is fed back at full speed. Pending idle work (redraws scheduled with after_idle)
+is flushed after each call so its cost is counted against the handler that caused it.
+Autosave/crash recovery is disabled so replays never touch the recovery folders.
+"""
+import argparse
+import json
+import sys
+import time
+import tkinter as tk
+
+import numpy as np
+
+from GEWP_main import TileBuilderApp, decode_session_arg
+
+
+def replay_session(session, repeat=1):
+    """Replays the session `repeat` times in a fresh app. Returns {handler name: [seconds]} and wall time."""
+    root = tk.Tk()
+    width, height = session["state"]["geometry"]
+    root.geometry(f"{width}x{height}")
+    app = TileBuilderApp(root, autosave=False)
+    events = [(name, [decode_session_arg(a) for a in args]) for _, name, args in session["events"]]
+
+    timings = {}
+    start = time.perf_counter()
+    try:
+        for _ in range(repeat):
+            app.apply_session_state(session)
+            root.update()
+            app.handler_timings = {}
+            for name, args in events:
+                handler_start = time.perf_counter()
+                getattr(app, name)(*args)
+                root.update_idletasks()
+                app.handler_timings.setdefault(name + " (+idle)", []).append(time.perf_counter() - handler_start)
+            for name, samples in app.handler_timings.items():
+                timings.setdefault(name, []).extend(samples)
+            app.handler_timings = None
+    finally:
+        root.destroy()
+    return timings, time.perf_counter() - start
+
+
+def summarize(timings):
+    """Count and p50/p90/p99/max in milliseconds per handler, slowest p99 first."""
+    rows = []
+    for name, samples in timings.items():
+        ms = np.array(samples) * 1000
+        p50, p90, p99 = np.percentile(ms, [50, 90, 99])
+        rows.append({"handler": name, "count": len(ms), "p50": p50, "p90": p90, "p99": p99, "max": ms.max()})
+    rows.sort(key=lambda row: row["p99"], reverse=True)
+    return rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Replay a recorded input session and report handler latency.")
+    parser.add_argument("session", help=".session file recorded with F9")
+    parser.add_argument("--repeat", type=int, default=1, help="replay the session this many times")
+    parser.add_argument("--json", help="also write the summary to this file")
+    args = parser.parse_args(argv)
+
+    with open(args.session) as f:
+        session = json.load(f)
+    if session.get("version") != 1:
+        print(f"{args.session}: unsupported session version {session.get('version')}", file=sys.stderr)
+        return 1
+
+    timings, elapsed = replay_session(session, args.repeat)
+    rows = summarize(timings)
+
+    print(f"{len(session['events'])} events x {args.repeat} in {elapsed:.2f}s")
+    print(f"{'handler':<36}{'count':>7}{'p50 ms':>10}{'p90 ms':>10}{'p99 ms':>10}{'max ms':>10}")
+    for row in rows:
+        print(f"{row['handler']:<36}{row['count']:>7}{row['p50']:>10.2f}{row['p90']:>10.2f}"
+              f"{row['p99']:>10.2f}{row['max']:>10.2f}")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"session": args.session, "repeat": args.repeat, "elapsed": elapsed, "handlers": rows}, f,
+                      indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,69 @@
+"""Runs map scripts on Grid Empire World Planner .map projects without opening the Tk app.
+
+    python GEWP_script.py terrain.py world.map                  # edits world.map in place
+    python GEWP_script.py terrain.py a.map b.map -o generated/
+    python GEWP_script.py walls.py world.map --tiles tiles/ --dry-run
+
+A script is plain Python with `map` (a MapModel) and `np` predefined. Scripts should only use
+map.map_data/map_rotation/map_mirror (read them, don't write them), map.tile_name_to_index,
+map.batch(), map.undo() and map.redo(), which is all the app's ScriptMap offers when the same
+script runs there with F5. Each batch becomes one undo record:
+
+    with map.batch() as b:
+        b.fill_rect(0, 50, 0, 10, b.width, "Dirt Block")
+        b.replace("Dirt Block", "Stone Block", region_mask=np.random.rand(b.height, b.width) < 0.1)
+
+Tile names come from the tile folder stored in each project (or --tiles). Exits with status 1
+if any script run failed; failed maps are not written.
+"""
+import argparse
+import os
+import sys
+import time
+import traceback
+
+from GEWP_main import MapModel, TileBuilderApp, read_project_file, read_tile_names, run_map_script, write_project_file
+
+
+def run_script_on_map(script_path, map_path, out_path, tile_dir=None, dry_run=False):
+    """Runs the script on one map and writes the result. Returns (batches applied, cells changed)."""
+    project = read_project_file(map_path, TileBuilderApp.NUM_LAYERS)
+    tile_dir = tile_dir or project['tile_dir']
+    model = MapModel(project['map_data'], project['map_rotation'], project['map_mirror'], read_tile_names(tile_dir))
+    run_map_script(script_path, model)
+
+    applied = model.history.entries[:model.history.position]
+    if applied and not dry_run:
+        write_project_file(out_path, model.map_data, model.map_rotation, model.map_mirror, project['tile_dir'])
+    return len(applied), sum(len(entry) for entry in applied)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run a map script on .map projects.")
+    parser.add_argument("script", help="Python map script")
+    parser.add_argument("maps", nargs="+", help=".map files to edit")
+    parser.add_argument("-o", "--output", help="output directory (default: overwrite each .map file)")
+    parser.add_argument("--tiles", help="tile folder for tile names (default: the tile_dir stored in each project)")
+    parser.add_argument("-n", "--dry-run", action="store_true", help="run the script but write nothing")
+    args = parser.parse_args(argv)
+
+    if args.output:
+        os.makedirs(args.output, exist_ok=True)
+
+    failures = 0
+    for map_path in args.maps:
+        out_path = os.path.join(args.output, os.path.basename(map_path)) if args.output else map_path
+        start = time.perf_counter()
+        try:
+            batches, cells = run_script_on_map(args.script, map_path, out_path, args.tiles, args.dry_run)
+        except Exception:
+            failures += 1
+            print(f"{map_path}: FAILED", file=sys.stderr)
+            traceback.print_exc()
+            continue
+        print(f"{map_path}: {batches} batches, {cells} cells changed in {time.perf_counter() - start:.2f}s")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,183 @@
+"""Sync server for collaborative editing in Grid Empire World Planner, plus a load benchmark.
+
+    python GEWP_sync.py serve                      # listen on localhost:8765
+    python GEWP_sync.py serve --port 9000
+    python GEWP_sync.py bench --clients 32 --edits 500
+
+Clients join with CTRL+K in the app. The server keeps the authoritative map: the first client
+to join supplies it, later ones receive it. Every cell/snapshot record a client sends is applied
+in arrival order and forwarded to all clients, flagged RECORD_ECHO for the sender, so every
+client sees the same edit order (see TileBuilderApp.apply_sync_record).
+
+The server has no authentication or encryption. Only bind it to another --host than localhost
+on a network where you trust everyone who can reach the port.
+"""
+import argparse
+import asyncio
+import socket
+import sys
+import time
+
+
+import numpy as np
+
+from GEWP_main import (RECORD_CELLS, RECORD_ECHO, RECORD_HEADER, RECORD_JOIN, RECORD_SNAPSHOT, SYNC_DEFAULT_PORT,
+                       TileBuilderApp, decode_cell_record, decode_snapshot_payload, encode_cell_record,
+                       encode_snapshot_record, read_record)
+
+
+class SyncServer:
+    def __init__(self):
+        self.clients = set()
+        self.arrays = None      # (map_data, map_rotation, map_mirror) once the first client joined
+        self.max_cells = 0      # Cells of the largest map held so far; larger cell records drop the client
+        self.bytes_in = 0
+        self.bytes_out = 0
+
+    async def handle_client(self, reader, writer):
+        writer.get_extra_info("socket").setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.clients.add(writer)
+        try:
+            while True:
+                kind, count, payload = await read_record(reader, self.max_cells)
+                record = RECORD_HEADER.pack(kind, count) + payload
+                self.bytes_in += len(record)
+                if kind == RECORD_JOIN:
+                    if self.arrays is None:
+                        self.set_arrays(decode_snapshot_payload(payload, TileBuilderApp.NUM_LAYERS))
+                    self.send(writer, encode_snapshot_record(*self.arrays))
+                    continue
+                if kind == RECORD_CELLS:
+                    self.apply_cells(*decode_cell_record(payload, count))
+                elif kind == RECORD_SNAPSHOT:
+                    self.set_arrays(decode_snapshot_payload(payload, TileBuilderApp.NUM_LAYERS))
+                else:
+                    continue
+                echo = RECORD_HEADER.pack(kind | RECORD_ECHO, count) + payload
+                for client in self.clients:
+                    self.send(client, echo if client is writer else record)
+        except (asyncio.IncompleteReadError, OSError, ValueError):
+            pass    # Disconnected, or sent an oversized/malformed record
+        finally:
+            self.clients.discard(writer)
+            writer.close()
+
+    def set_arrays(self, arrays):
+        self.arrays = arrays
+        self.max_cells = max(self.max_cells, arrays[0].size)
+
+    def apply_cells(self, cells, idx, rot, mirror):
+        if self.arrays is None:
+            return
+        map_data, map_rotation, map_mirror = self.arrays
+        inside = np.ones(len(idx), dtype=bool)
+        for axis, size in zip(cells, map_data.shape):
+            inside &= axis < size
+        cells = tuple(axis[inside] for axis in cells)
+        map_data[cells], map_rotation[cells], map_mirror[cells] = idx[inside], rot[inside], mirror[inside]
+
+    def send(self, writer, record):
+        self.bytes_out += len(record)
+        writer.write(record)
+
+
+async def serve(host, port):
+    server = SyncServer()
+    listener = await asyncio.start_server(server.handle_client, host, port)
+    print(f"Sync server listening on {host}:{port}")
+    async with listener:
+        await listener.serve_forever()
+
+
+# --- Benchmark ---
+async def bench_painter(host, port, painter, edits, interval, bench_state):
+    """Simulated client: paints one cell every interval seconds and times every cell record it
+    receives (own echoes and other painters' edits) against the moment it was sent."""
+    reader, writer = await asyncio.open_connection(host, port)
+    writer.get_extra_info("socket").setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    empty = np.zeros((TileBuilderApp.NUM_LAYERS, TileBuilderApp.MAP_HEIGHT, TileBuilderApp.MAP_WIDTH), dtype=np.uint16)
+    writer.write(encode_snapshot_record(empty, empty.astype(np.uint8), empty.astype(np.uint8), RECORD_JOIN))
+    await read_record(reader, 0)   # The server's map
+    bench_state["joined"] += 1
+    if bench_state["joined"] == bench_state["painters"]:
+        bench_state["all_joined"].set()
+    await bench_state["all_joined"].wait()
+
+    sent_at = bench_state["sent_at"]
+    latencies = bench_state["latencies"]
+
+    async def receive():
+        for _ in range(edits * bench_state["painters"]):
+            kind, count, payload = await read_record(reader, empty.size)
+            now = time.perf_counter()
+            (_, rows, _), idx, _, _ = decode_cell_record(payload, count)
+            # The painter is encoded in the row and the edit number in the tile index
+            latencies.append(now - sent_at[int(rows[0]), int(idx[0])])
+
+    receiver = asyncio.get_running_loop().create_task(receive())
+    for n in range(edits):
+        sent_at[painter, n + 1] = time.perf_counter()
+        writer.write(encode_cell_record(([0], [painter], [n % TileBuilderApp.MAP_WIDTH]), [n + 1], [0], [0]))
+        await writer.drain()
+        await asyncio.sleep(interval)
+    await receiver
+    writer.close()
+
+
+async def bench(painters, edits, rate):
+    """Runs the server and painters in one event loop. Returns (latencies in ms, seconds, bytes in, bytes out)
+    for the editing phase."""
+    server = SyncServer()
+    listener = await asyncio.start_server(server.handle_client, "127.0.0.1", 0)
+    host, port = listener.sockets[0].getsockname()[:2]
+    bench_state = {"painters": painters, "joined": 0, "all_joined": asyncio.Event(), "sent_at": {}, "latencies": []}
+
+    async def measure():
+        await bench_state["all_joined"].wait()
+        counters = (time.perf_counter(), server.bytes_in, server.bytes_out)
+        await tasks
+        return counters
+
+    async with listener:
+        tasks = asyncio.gather(*(
+            bench_painter(host, port, painter, edits, 1 / rate, bench_state) for painter in range(painters)
+        ))
+        start, bytes_in, bytes_out = await measure()
+    elapsed = time.perf_counter() - start
+    latencies = np.array(bench_state["latencies"]) * 1000
+    return latencies, elapsed, server.bytes_in - bytes_in, server.bytes_out - bytes_out
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Collaborative sync server for Grid Empire World Planner.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    serve_parser = commands.add_parser("serve", help="run the sync server")
+    serve_parser.add_argument("--host", default="localhost", help="interface to listen on (unauthenticated, keep it local)")
+    serve_parser.add_argument("--port", type=int, default=SYNC_DEFAULT_PORT)
+    bench_parser = commands.add_parser("bench", help="measure latency/bandwidth with simulated painters")
+    bench_parser.add_argument("--clients", type=int, default=16, help="concurrent painters")
+    bench_parser.add_argument("--edits", type=int, default=200, help="cell edits per painter")
+    bench_parser.add_argument("--rate", type=float, default=60, help="edits per second per painter")
+    args = parser.parse_args(argv)
+
+    if args.command == "serve":
+        try:
+            asyncio.run(serve(args.host, args.port))
+        except KeyboardInterrupt:
+            pass
+        return 0
+
+    if args.clients > TileBuilderApp.MAP_HEIGHT:
+        parser.error(f"at most {TileBuilderApp.MAP_HEIGHT} painters (one map row each)")
+    latencies, elapsed, bytes_in, bytes_out = asyncio.run(bench(args.clients, args.edits, args.rate))
+    p50, p90, p99 = np.percentile(latencies, [50, 90, 99])
+    print(f"{args.clients} painters x {args.edits} edits at {args.rate:g}/s in {elapsed:.2f}s")
+    print(f"delivery latency ms: p50 {p50:.2f}  p90 {p90:.2f}  p99 {p99:.2f}  max {latencies.max():.2f} "
+          f"({len(latencies)} deliveries)")
+    print(f"server traffic: {bytes_in / elapsed / 1024:.1f} KiB/s in, {bytes_out / elapsed / 1024:.1f} KiB/s out, "
+          f"{bytes_in / (args.clients * args.edits):.0f} B per edit")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
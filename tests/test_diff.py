@@ -0,0 +1,103 @@
+import numpy as np
+
+from GEWP_main import (DIFF_ADDED, DIFF_CHANGED, DIFF_CONFLICT, DIFF_REMOVED, DIFF_UNCHANGED, count_changes,
+                       diff_maps, merge_maps)
+
+
+def make_map(height=4, width=5):
+    shape = (2, height, width)
+    return np.zeros(shape, np.uint16), np.zeros(shape, np.uint8), np.zeros(shape, np.uint8)
+
+
+def copy_map(arrays):
+    return tuple(array.copy() for array in arrays)
+
+
+def test_diff_kinds():
+    old = make_map()
+    old[0][0, 0, 0] = 1
+    old[0][0, 0, 1] = 2
+    old[0][1, 2, 2] = 3
+    new = copy_map(old)
+    new[0][0, 0, 0] = 0             # removed
+    new[0][0, 1, 1] = 4             # added
+    new[0][1, 2, 2] = 5             # changed tile
+    new[1][0, 0, 1] = 1             # changed rotation only
+
+    kinds = diff_maps(old, new)
+    assert kinds[0, 0, 0] == DIFF_REMOVED
+    assert kinds[0, 1, 1] == DIFF_ADDED
+    assert kinds[1, 2, 2] == DIFF_CHANGED
+    assert kinds[0, 0, 1] == DIFF_CHANGED
+    assert count_changes(kinds) == [{"added": 1, "removed": 1, "changed": 1}, {"changed": 1}]
+
+
+def test_diff_ignores_transform_of_empty_cells():
+    old = make_map()
+    new = copy_map(old)
+    new[1][0, 3, 3] = 2
+    new[2][1, 0, 0] = 1
+    assert (diff_maps(old, new) == DIFF_UNCHANGED).all()
+
+
+def test_diff_pads_smaller_map():
+    old = make_map(2, 2)
+    old[0][0, 1, 1] = 7
+    new = make_map(3, 4)
+    new[0][0, 1, 1] = 7
+    new[0][0, 2, 3] = 1
+
+    kinds = diff_maps(old, new)
+    assert kinds.shape == (2, 3, 4)
+    assert kinds[0, 1, 1] == DIFF_UNCHANGED
+    assert kinds[0, 2, 3] == DIFF_ADDED
+    assert (diff_maps(new, old)[0, 2, 3]) == DIFF_REMOVED
+
+
+def test_merge_takes_one_sided_changes():
+    base = make_map()
+    base[0][0, 0, 0] = 1
+    ours, theirs = copy_map(base), copy_map(base)
+    ours[0][0, 1, 0] = 2
+    theirs[0][1, 3, 4] = 3
+    theirs[0][0, 0, 0] = 0
+
+    merged, kinds = merge_maps(base, ours, theirs)
+    assert merged[0][0, 1, 0] == 2
+    assert merged[0][1, 3, 4] == 3
+    assert merged[0][0, 0, 0] == 0
+    assert DIFF_CONFLICT not in kinds
+    assert kinds[0, 0, 0] == DIFF_REMOVED
+    assert kinds[0, 1, 0] == DIFF_ADDED
+
+
+def test_merge_conflict_keeps_ours():
+    base = make_map()
+    base[0][0, 2, 2] = 1
+    ours, theirs = copy_map(base), copy_map(base)
+    ours[0][0, 2, 2] = 2
+    theirs[0][0, 2, 2] = 3
+    ours[0][1, 0, 0] = 4            # same change on both sides is not a conflict
+    theirs[0][1, 0, 0] = 4
+    ours[1][0, 3, 3], ours[0][0, 3, 3] = 1, 5      # same tile, different rotation
+    theirs[0][0, 3, 3] = 5
+
+    merged, kinds = merge_maps(base, ours, theirs)
+    assert merged[0][0, 2, 2] == 2
+    assert kinds[0, 2, 2] == DIFF_CONFLICT
+    assert kinds[1, 0, 0] == DIFF_ADDED
+    assert kinds[0, 3, 3] == DIFF_CONFLICT
+    assert merged[1][0, 3, 3] == 1
+    assert (kinds == DIFF_CONFLICT).sum() == 2
+
+
+def test_merge_of_different_sizes():
+    base = make_map(2, 2)
+    ours = make_map(2, 2)
+    theirs = make_map(3, 3)
+    theirs[0][0, 2, 2] = 6
+
+    merged, kinds = merge_maps(base, ours, theirs)
+    assert merged[0].shape == (2, 3, 3)
+    assert merged[0][0, 2, 2] == 6
+    assert kinds[0, 2, 2] == DIFF_ADDED
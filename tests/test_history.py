@@ -0,0 +1,94 @@
+import numpy as np
+
+from GEWP_main import EditHistory, MapSnapshot, MapStateAction, apply_history_entry
+
+
+def empty_map():
+    shape = (2, 3, 3)
+    return np.zeros(shape, np.uint16), np.zeros(shape, np.uint8), np.zeros(shape, np.uint8)
+
+
+def build_history(edits, max_entries=100, checkpoint_interval=4):
+    """Records one single-cell edit per step, as the app does. Returns (history, live map, maps
+    after each step)."""
+    history = EditHistory(max_entries, checkpoint_interval)
+    arrays = empty_map()
+    history.reset(MapSnapshot(*arrays))
+    states = [tuple(a.copy() for a in arrays)]
+    for step in range(edits):
+        cell = (step % 2, step % 3, (step // 3) % 3)
+        old = int(arrays[0][cell])
+        entry = (*cell, old, 0, 0, step + 1, step % 4, 0)
+        arrays = apply_history_entry(arrays, entry, False)
+        history.record(entry)
+        if history.checkpoint_due():
+            history.add_checkpoint(MapSnapshot(*arrays))
+        states.append(tuple(a.copy() for a in arrays))
+    return history, arrays, states
+
+
+def jump(history, arrays, target):
+    snapshot, steps = history.path_to(target)
+    if snapshot is not None:
+        arrays = snapshot.arrays()
+    for entry, is_undo in steps:
+        arrays = apply_history_entry(arrays, entry, is_undo)
+    history.position = target
+    return arrays
+
+
+def assert_maps_equal(a, b):
+    for x, y in zip(a, b):
+        np.testing.assert_array_equal(x, y)
+
+
+def test_path_to_every_position():
+    history, arrays, states = build_history(11)
+    for target in (0, 11, 3, 4, 9, 1, 8, 8, 0, 6):
+        arrays = jump(history, arrays, target)
+        assert_maps_equal(arrays, states[target])
+
+
+def test_path_to_prefers_cheapest_route():
+    history, _, _ = build_history(11)
+    snapshot, steps = history.path_to(10)
+    assert snapshot is None and [is_undo for _, is_undo in steps] == [True]
+    snapshot, steps = history.path_to(1)
+    assert snapshot is history.checkpoints[0] and len(steps) == 1
+    snapshot, steps = history.path_to(11)
+    assert snapshot is None and steps == []
+
+
+def test_record_drops_redo():
+    history, arrays, states = build_history(6)
+    arrays = jump(history, arrays, 3)
+    history.record((0, 2, 2, 0, 0, 0, 9, 0, 0))
+    assert len(history.entries) == 4 and history.position == 4
+    assert max(history.checkpoints) <= 4
+    assert history.step(False) is None
+
+
+def test_trim_cuts_at_checkpoint():
+    history, arrays, states = build_history(10, max_entries=6, checkpoint_interval=4)
+    # Over the limit, so the history starts at the first checkpoint that keeps at most 6 records
+    assert len(history.entries) == 6 and history.position == 6
+    assert 0 in history.checkpoints
+    arrays = jump(history, arrays, 0)
+    assert_maps_equal(arrays, states[4])
+    arrays = jump(history, arrays, 6)
+    assert_maps_equal(arrays, states[10])
+
+
+def test_trim_waits_for_a_checkpoint():
+    history, _, _ = build_history(7, max_entries=5, checkpoint_interval=100)
+    assert len(history.entries) == 7 and history.position == 7
+
+
+def test_map_state_action_adds_checkpoints():
+    history, arrays, _ = build_history(2)
+    before = MapSnapshot(*arrays)
+    after = MapSnapshot(*(np.ones_like(a) for a in arrays))
+    history.record(MapStateAction(before, after))
+    assert history.checkpoints[2] is before and history.checkpoints[3] is after
+    snapshot, steps = history.path_to(2)
+    assert snapshot is before and steps == []
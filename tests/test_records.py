@@ -0,0 +1,121 @@
+import asyncio
+import zlib
+
+import numpy as np
+import pytest
+
+from GEWP_main import (RECORD_CELLS, RECORD_HEADER, RECORD_JOIN, RECORD_SNAPSHOT, SYNC_MAX_SNAPSHOT_BYTES,
+                       EditJournal, decode_cell_record, decode_snapshot_payload, encode_cell_record,
+                       encode_snapshot_record, pack_arrays, read_record, record_payload_size, unpack_arrays)
+
+
+def sample_cells():
+    cells = (np.array([0, 1, 1]), np.array([2, 0, 70000]), np.array([5, 3, 1]))
+    return cells, np.array([1, 65535, 7]), np.array([0, 3, 1]), np.array([1, 0, 1])
+
+
+def read_from_bytes(data, max_cells):
+    async def read():
+        reader = asyncio.StreamReader()
+        reader.feed_data(data)
+        reader.feed_eof()
+        return await read_record(reader, max_cells)
+    return asyncio.run(read())
+
+
+def test_cell_record_round_trip():
+    cells, idx, rot, mirror = sample_cells()
+    record = encode_cell_record(cells, idx, rot, mirror)
+    kind, count = RECORD_HEADER.unpack_from(record)
+    assert (kind, count) == (RECORD_CELLS, 3)
+    assert len(record) == RECORD_HEADER.size + record_payload_size(kind, count)
+
+    decoded = decode_cell_record(record, count, RECORD_HEADER.size)
+    for expected, actual in zip(cells, decoded[0]):
+        np.testing.assert_array_equal(actual, expected)
+    for expected, actual in zip((idx, rot, mirror), decoded[1:]):
+        np.testing.assert_array_equal(actual, expected)
+
+
+def test_cell_record_broadcasts_transforms():
+    cells = (np.array([1, 1]), np.array([4, 5]), np.array([6, 6]))
+    record = encode_cell_record(cells, np.array([9, 9]), 2, 0)
+    _, idx, rot, mirror = decode_cell_record(record, 2, RECORD_HEADER.size)
+    assert idx.tolist() == [9, 9] and rot.tolist() == [2, 2] and mirror.tolist() == [0, 0]
+
+
+def test_read_record_within_limits():
+    record = encode_cell_record(*sample_cells())
+    kind, count, payload = read_from_bytes(record, 3)
+    assert (kind, count) == (RECORD_CELLS, 3)
+    assert payload == record[RECORD_HEADER.size:]
+
+
+def test_read_record_rejects_oversized_cell_record():
+    record = encode_cell_record(*sample_cells())
+    with pytest.raises(ValueError):
+        read_from_bytes(record, 2)
+
+
+def test_read_record_rejects_oversized_snapshot_before_reading_it():
+    header = RECORD_HEADER.pack(RECORD_SNAPSHOT, SYNC_MAX_SNAPSHOT_BYTES + 1)
+    with pytest.raises(ValueError):
+        read_from_bytes(header, 0)
+
+
+def test_read_record_truncated():
+    record = encode_cell_record(*sample_cells())
+    with pytest.raises(asyncio.IncompleteReadError):
+        read_from_bytes(record[:-1], 3)
+    with pytest.raises(asyncio.IncompleteReadError):
+        read_from_bytes(record[:2], 3)
+
+
+def test_journal_stops_at_truncated_record(tmp_path):
+    first = encode_cell_record(*sample_cells())
+    second = encode_cell_record((np.array([0]), np.array([1]), np.array([1])), np.array([4]), 0, 0)
+    path = tmp_path / "journal.0.bin"
+    path.write_bytes(first + second[:-2])
+    records = list(EditJournal.read_records(str(path)))
+    assert len(records) == 1
+    assert records[0][1].tolist() == [1, 65535, 7]
+
+
+def test_snapshot_round_trip():
+    shape = (2, 3, 4)
+    map_data = np.arange(24, dtype=np.uint16).reshape(shape)
+    map_rotation = np.full(shape, 3, np.uint8)
+    map_mirror = np.ones(shape, np.uint8)
+    record = encode_snapshot_record(map_data, map_rotation, map_mirror, RECORD_JOIN)
+    kind, count, payload = read_from_bytes(record, 0)
+    assert kind == RECORD_JOIN
+    decoded = decode_snapshot_payload(payload)
+    for expected, actual in zip((map_data, map_rotation, map_mirror), decoded):
+        assert actual.dtype == expected.dtype
+        np.testing.assert_array_equal(actual, expected)
+
+
+@pytest.mark.parametrize("arrays", [
+    {"map_data": np.zeros(10, np.uint16), "map_rotation": np.zeros(10, np.uint8), "map_mirror": np.zeros(10, np.uint8)},
+    {"map_data": np.zeros((3, 2, 2), np.uint16), "map_rotation": np.zeros((3, 2, 2), np.uint8),
+     "map_mirror": np.zeros((3, 2, 2), np.uint8)},
+    {"map_data": np.zeros((2, 2, 2), np.uint16), "map_rotation": np.zeros((2, 2, 3), np.uint8),
+     "map_mirror": np.zeros((2, 2, 2), np.uint8)},
+    {"map_data": np.zeros((2, 2, 2), np.int64), "map_rotation": np.zeros((2, 2, 2), np.uint8),
+     "map_mirror": np.zeros((2, 2, 2), np.uint8)},
+    {"map_data": np.zeros((2, 2, 2), np.uint16), "map_rotation": np.zeros((2, 2, 2), np.uint8)},
+])
+def test_snapshot_rejects_malformed_maps(arrays):
+    with pytest.raises(ValueError):
+        decode_snapshot_payload(pack_arrays(**arrays))
+
+
+def test_snapshot_rejects_garbage_and_bombs():
+    with pytest.raises(ValueError):
+        decode_snapshot_payload(b"not a snapshot")
+    with pytest.raises(ValueError):
+        decode_snapshot_payload(zlib.compress(b"\0" * (100 * 1024 * 1024)))
+    with pytest.raises(ValueError):
+        unpack_arrays(zlib.compress(b"\0" * 1000), 999)
+    with pytest.raises(ValueError):
+        unpack_arrays(zlib.compress(b"\0" * 1000)[:-4], 2000)
@@ -0,0 +1,80 @@
+import numpy as np
+import pytest
+
+from GEWP_main import apply_history_entry, apply_reshape_action, content_bounds, make_reshape_action
+
+
+def random_map(height=5, width=7, seed=0):
+    rng = np.random.default_rng(seed)
+    shape = (2, height, width)
+    map_data = rng.integers(0, 4, shape).astype(np.uint16)
+    map_rotation = rng.integers(0, 4, shape).astype(np.uint8)
+    map_mirror = rng.integers(0, 2, shape).astype(np.uint8)
+    return map_data, map_rotation, map_mirror
+
+
+def assert_maps_equal(a, b):
+    for x, y in zip(a, b):
+        assert x.shape == y.shape
+        np.testing.assert_array_equal(x, y)
+
+
+@pytest.mark.parametrize("shape, offset", [
+    ((5, 7), (2, 3)),           # shift, cells fall off the bottom right
+    ((5, 7), (-2, -3)),         # shift the other way
+    ((3, 4), (-1, -2)),         # crop
+    ((8, 9), (1, 2)),           # grow
+    ((6, 3), (-4, 5)),          # everything falls off
+])
+def test_reshape_undo_restores_map(shape, offset):
+    arrays = random_map()
+    action = make_reshape_action(*arrays, shape, offset)
+    reshaped = apply_reshape_action(arrays, action, False)
+    assert reshaped[0].shape == (2, *shape)
+    assert_maps_equal(apply_reshape_action(reshaped, action, True), arrays)
+    assert_maps_equal(apply_reshape_action(apply_reshape_action(reshaped, action, True), action, False), reshaped)
+
+
+def test_shift_moves_cells():
+    arrays = random_map()
+    reshaped = apply_reshape_action(arrays, make_reshape_action(*arrays, (5, 7), (-1, 2)), False)
+    np.testing.assert_array_equal(reshaped[0][:, 0:4, 2:7], arrays[0][:, 1:5, 0:5])
+    assert not reshaped[0][:, 4, :].any()
+    assert not reshaped[0][:, :, :2].any()
+
+
+@pytest.mark.parametrize("offset", [(1, 2), (-1, -3), (-6, 15)])
+def test_wrap_keeps_every_cell(offset):
+    arrays = random_map()
+    action = make_reshape_action(*arrays, (5, 7), offset, wrap=True)
+    assert len(action) == 0
+    assert 0 <= action.offset[0] < 5 and 0 <= action.offset[1] < 7
+    wrapped = apply_reshape_action(arrays, action, False)
+    for original, moved in zip(arrays, wrapped):
+        np.testing.assert_array_equal(moved, np.roll(original, offset, axis=(1, 2)))
+    assert_maps_equal(apply_history_entry(wrapped, action, True), arrays)
+
+
+def test_wrap_by_full_size_is_no_change():
+    arrays = random_map()
+    assert make_reshape_action(*arrays, (5, 7), (5, -7), wrap=True) is None
+    assert make_reshape_action(*arrays, (5, 7), (0, 0)) is None
+
+
+def test_invalid_reshapes():
+    arrays = random_map()
+    with pytest.raises(ValueError):
+        make_reshape_action(*arrays, (6, 7), (1, 0), wrap=True)
+    with pytest.raises(ValueError):
+        make_reshape_action(*arrays, (0, 7), (0, 0))
+
+
+def test_only_lost_cells_are_stored():
+    arrays = tuple(np.zeros((2, 4, 4), dtype) for dtype in (np.uint16, np.uint8, np.uint8))
+    arrays[0][1, 1, 1] = 3
+    arrays[1][0, 3, 3] = 2          # empty tile with a rotation still counts
+    assert content_bounds(arrays[0]) == (1, 1, 2, 2)
+
+    action = make_reshape_action(*arrays, (2, 2), (-1, -1))
+    assert len(action) == 1
+    assert_maps_equal(apply_reshape_action(apply_reshape_action(arrays, action, False), action, True), arrays)
@@ -0,0 +1,124 @@
+import json
+
+import numpy as np
+import pytest
+from PIL import Image
+
+import GEWP_main
+from GEWP_main import SpriteNameTable, encode_data_url, read_web_map_file, write_web_map_file
+
+TILE_COLORS = {"Dirt Block": (120, 80, 40, 255), "Stone Block": (128, 128, 128, 255), "Leaves": (0, 160, 0, 128)}
+
+
+def tile_image(name):
+    img = Image.new("RGBA", (32, 32), TILE_COLORS[name])
+    img.putpixel((0, 0), (255, 255, 255, 255))     # asymmetric, so rotation and mirroring show
+    return img
+
+
+@pytest.fixture
+def tiles():
+    names = sorted(TILE_COLORS)
+    tile_name_to_index = {name: i + 1 for i, name in enumerate(names)}
+    tile_images = {i + 1: tile_image(name) for i, name in enumerate(names)}
+    return tile_name_to_index, tile_images
+
+
+@pytest.fixture
+def sprite_table(tmp_path):
+    sheet = Image.new("RGBA", (32 * len(TILE_COLORS), 32))
+    frames = {}
+    for i, name in enumerate(TILE_COLORS):
+        sheet.paste(tile_image(name), (32 * i, 0))
+        frames[name] = {"frame": {"x": 32 * i, "y": 0, "w": 32, "h": 32}, "index": i}
+    sheet.save(tmp_path / "spritesheet1.png")
+    (tmp_path / "spritesheet1.json").write_text(json.dumps({"frames": frames, "meta": {}}))
+    return SpriteNameTable(str(tmp_path))
+
+
+def sample_map(height=60, width=100):
+    shape = (2, height, width)
+    map_data = np.zeros(shape, np.uint16)
+    map_rotation = np.zeros(shape, np.uint8)
+    map_mirror = np.zeros(shape, np.uint8)
+    map_data[0, 0, 0], map_rotation[0, 0, 0] = 1, 1
+    map_data[0, 59, 99], map_mirror[0, 59, 99] = 2, 1
+    map_data[1, 10, 20], map_rotation[1, 10, 20], map_mirror[1, 10, 20] = 3, 3, 1
+    map_data[1, 11, 20] = 1
+    return map_data, map_rotation, map_mirror
+
+
+def assert_round_trip(project, arrays):
+    for key, expected in zip(("map_data", "map_rotation", "map_mirror"), arrays):
+        np.testing.assert_array_equal(project[key], expected)
+    assert project["unmatched"] == 0 and project["skipped_water"] == 0
+
+
+def index_to_name(tile_name_to_index):
+    return {index: name for name, index in tile_name_to_index.items()}
+
+
+def test_full_format_round_trip(tmp_path, tiles, sprite_table):
+    tile_name_to_index, tile_images = tiles
+    arrays = sample_map()
+    path = tmp_path / "world.json"
+    write_web_map_file(path, *arrays, tile_images, index_to_name(tile_name_to_index), sprite_table)
+    assert_round_trip(read_web_map_file(path, tile_name_to_index, sprite_table), arrays)
+
+
+def test_full_format_split_across_chunks(tmp_path, tiles, sprite_table, monkeypatch):
+    tile_name_to_index, tile_images = tiles
+    arrays = sample_map()
+    path = tmp_path / "world.json"
+    write_web_map_file(path, *arrays, tile_images, index_to_name(tile_name_to_index), sprite_table)
+    monkeypatch.setattr(GEWP_main, "WEB_READ_CHUNK", 37)
+    assert_round_trip(read_web_map_file(path, tile_name_to_index, sprite_table), arrays)
+
+
+def test_compact_format_round_trip(tmp_path, tiles):
+    tile_name_to_index, tile_images = tiles
+    arrays = sample_map()
+    path = tmp_path / "world.json"
+    write_web_map_file(path, *arrays, tile_images, index_to_name(tile_name_to_index), compact=True)
+    assert json.loads(path.read_text())["v"] == 2
+    assert_round_trip(read_web_map_file(path, tile_name_to_index, None), arrays)
+
+
+def test_map_grows_to_fit_cells(tmp_path, tiles):
+    tile_name_to_index, tile_images = tiles
+    arrays = sample_map(70, 130)
+    arrays[0][0, 69, 129] = 1
+    path = tmp_path / "world.json"
+    write_web_map_file(path, *arrays, tile_images, index_to_name(tile_name_to_index), compact=True)
+    project = read_web_map_file(path, tile_name_to_index, None)
+    assert project["map_data"].shape == (2, 70, 130)
+    assert_round_trip(project, arrays)
+
+
+def test_water_unmatched_and_autotile_cells(tmp_path, tiles, sprite_table):
+    tile_name_to_index, _ = tiles
+    unknown = encode_data_url(Image.new("RGBA", (32, 32), (1, 2, 3, 255)))
+    dirt = encode_data_url(tile_image("Dirt Block"))
+    web_map = {
+        "background": {"1,2": {"src": dirt, "rotation": 90, "flipped": True},
+                       "3,4": {"src": unknown, "rotation": 0, "flipped": False},
+                       "-1,0": {"src": dirt, "rotation": 0, "flipped": False}},
+        "foreground": {},
+        "water": {"0,0": {"src": dirt, "rotation": 0, "flipped": False}},
+    }
+    path = tmp_path / "world.json"
+    path.write_text(json.dumps(web_map))
+    project = read_web_map_file(path, tile_name_to_index, sprite_table)
+    assert project["map_data"][0, 2, 1] == tile_name_to_index["Dirt Block"]
+    assert project["map_rotation"][0, 2, 1] == 3 and project["map_mirror"][0, 2, 1] == 1
+    assert project["map_data"][0, 4, 3] == 0
+    assert project["map_data"].shape == (2, 60, 100)
+    assert project["unmatched"] == 1 and project["skipped_water"] == 1
+
+    compact = {"v": 2, "m": ["Stone Block_85", "Nope"], "bg": {"5,6": {"i": 0, "r": 180, "f": 0}},
+               "fg": {"7,8": {"i": 1}}, "wt": {}}
+    path.write_text(json.dumps(compact))
+    project = read_web_map_file(path, tile_name_to_index, None)
+    assert project["map_data"][0, 6, 5] == tile_name_to_index["Stone Block"]
+    assert project["map_rotation"][0, 6, 5] == 2
+    assert project["unmatched"] == 1